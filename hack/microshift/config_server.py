@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""First-boot configuration UI for a Jumpstarter appliance running MicroShift.
+
+Serves a small web page that lets the user download the admin kubeconfig,
+set the root password and host name, and create/update the Jumpstarter
+custom resource. All pages are protected by HTTP Basic auth checked
+against the host's PAM stack.
+"""
+
+import crypt
+import hashlib
+import json
+import os
+import re
+import secrets
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from pathlib import Path
+
+from flask import Flask, Response, request
+import urllib3
+from kubernetes import client as k8s_client
+from kubernetes import config as k8s_config
+
+try:
+    import pam
+except ImportError:
+    # Auth fails closed if the PAM binding is missing.
+    pam = None
+
+try:
+    from pyroute2 import IPRoute
+    from pyroute2.netlink.exceptions import NetlinkError
+except ImportError:
+    # Without pyroute2 the default-route lookup forks the ip binary.
+    IPRoute = None
+    NetlinkError = OSError
+
+KUBECONFIG_PATH = Path("/var/lib/microshift/resources/kubeadmin/kubeconfig")
+
+# Patterns used to rewrite the downloaded kubeconfig, compiled once.
+_RE_SERVER_LOCALHOST = re.compile(r"server:\s+https://localhost:(\d+)")
+_RE_SERVER_LINE = re.compile(r"(server:\s+https://[^\n]+\n)")
+DEFAULT_IMAGE = "quay.io/jumpstarter-dev/jumpstarter-controller:latest"
+JUMPSTARTER_NAMESPACE = "jumpstarter-lab"
+
+# A hung child process or apiserver call must not pin a worker thread
+# forever; everything the handlers wait on is bounded.
+SUBPROCESS_TIMEOUT = 30.0
+K8S_REQUEST_TIMEOUT = 30
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Jumpstarter Appliance Setup</title>
+<link rel="stylesheet" href="{{ url_for('static', filename='app.css') }}">
+</head>
+<body>
+<div class="container">
+<h1>Jumpstarter Appliance Setup</h1>
+{% for success, text in messages %}
+<div class="message {{ 'success' if success else 'error' }}">{{ text }}</div>
+{% endfor %}
+<h2>Kubeconfig</h2>
+<p class="hint">Download the admin kubeconfig for this appliance.</p>
+<a class="download" href="/kubeconfig">Download kubeconfig</a>
+<h2>Configure appliance</h2>
+<p class="hint">Current hostname: {{ current_hostname }}</p>
+<form method="post" action="/configure-jumpstarter">
+<label for="root_password">Root password</label>
+<input type="password" id="root_password" name="root_password">
+<label for="base_domain">Base domain</label>
+<input type="text" id="base_domain" name="base_domain"
+       value="{{ suggested_hostname }}">
+<label for="image">Image</label>
+<input type="text" id="image" name="image" value="{{ default_image }}">
+<button type="submit">Configure Jumpstarter</button>
+</form>
+</div>
+</body>
+</html>"""
+
+app = Flask(__name__)
+
+# The only POST is a small form; cap the body so a client cannot stream
+# an unbounded request into the worker. Flask answers 413 beyond this.
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024
+
+# Compress the HTML page and kubeconfig transparently when the client
+# accepts it; both are highly compressible text. flask-compress is
+# optional so the UI still runs on images without it. The kubeconfig is
+# served as application/octet-stream, which is not in flask-compress's
+# default mimetype list, so it is added explicitly; the threshold stays
+# at the library default of 500 bytes so the HTML shell and stylesheet
+# qualify too.
+app.config["COMPRESS_MIMETYPES"] = [
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/json",
+    "application/javascript",
+    "application/octet-stream",
+]
+app.config["COMPRESS_MIN_SIZE"] = 500
+app.config["COMPRESS_LEVEL"] = 6
+try:
+    from flask_compress import Compress
+
+    Compress(app)
+except ImportError:
+    pass
+
+# Compile the template once at import time; per-request rendering then
+# skips the Jinja lexer and parser entirely.
+INDEX_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+
+@app.after_request
+def _cache_static(response):
+    # Static assets are immutable for a given image build; let browsers
+    # keep them so repeat page loads only fetch the small dynamic HTML.
+    if request.path.startswith("/static/"):
+        response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+    return response
+
+
+# Successful Basic-auth credentials are remembered for a short window so
+# the PAM stack (config parsing, module dlopens, shadow reads) only runs
+# on the first request from a browser, not on every page load. Passwords
+# are never stored; the cache key is a keyed hash under a per-process
+# random key.
+_session_key = secrets.token_bytes(32)
+_auth_cache = {}
+_auth_lock = threading.Lock()
+AUTH_TTL = 60.0
+
+
+def check_auth(username, password):
+    """Validate credentials against the host's PAM stack, with caching."""
+    digest = hashlib.blake2b(
+        password.encode(), key=_session_key, digest_size=16
+    ).digest()
+    key = (username, digest)
+    now = time.monotonic()
+    with _auth_lock:
+        ts = _auth_cache.get(key)
+        if ts is not None and now - ts < AUTH_TTL:
+            return True
+    if pam is None or not pam.pam().authenticate(username, password):
+        return False
+    with _auth_lock:
+        if len(_auth_cache) > 128:
+            _auth_cache.clear()
+        _auth_cache[key] = now
+    return True
+
+
+def requires_auth(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        auth = request.authorization
+        # Non-Basic schemes (e.g. Bearer) parse into an Authorization
+        # object with username/password set to None; treat them as
+        # unauthenticated rather than letting check_auth hash None.
+        if (
+            not auth
+            or auth.type != "basic"
+            or auth.username is None
+            or auth.password is None
+            or not check_auth(auth.username, auth.password)
+        ):
+            return Response(
+                "Authentication required",
+                401,
+                {"WWW-Authenticate": 'Basic realm="Jumpstarter Setup"'},
+            )
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+# The hostname and default-route IP almost never change between requests,
+# so both lookups are memoized with a short TTL to keep syscalls and
+# subprocess forks off the request hot path.
+_hostname_cache = {"val": None, "exp": 0.0}
+_hostname_lock = threading.Lock()
+_ip_cache = {"val": None, "exp": 0.0}
+_ip_lock = threading.Lock()
+
+HOSTNAME_TTL = 5.0
+IP_TTL = 30.0
+
+
+def get_current_hostname():
+    """Return the hostname of the host."""
+    with _hostname_lock:
+        if time.monotonic() < _hostname_cache["exp"]:
+            return _hostname_cache["val"]
+        hostname = socket.gethostname()
+        _hostname_cache["val"] = hostname
+        _hostname_cache["exp"] = time.monotonic() + HOSTNAME_TTL
+        return hostname
+
+
+def get_default_route_ip():
+    """Return the IPv4 address of the default-route interface, cached.
+
+    The address is returned with dots replaced by dashes so it can be
+    embedded in a nip.io hostname. Returns None if it cannot be determined.
+    """
+    with _ip_lock:
+        if time.monotonic() < _ip_cache["exp"]:
+            return _ip_cache["val"]
+        ip = _lookup_default_route_ip()
+        _ip_cache["val"] = ip
+        _ip_cache["exp"] = time.monotonic() + IP_TTL
+        return ip
+
+
+def _lookup_default_route_ip():
+    if IPRoute is not None:
+        try:
+            ip = _default_route_ip_from_netlink()
+            if ip is not None:
+                return ip
+        except (OSError, NetlinkError):
+            # NetlinkError subclasses Exception, not OSError; fall back to
+            # the ip binary on any netlink failure.
+            pass
+    return _default_route_ip_from_iproute()
+
+
+def _default_route_ip_from_netlink():
+    """Resolve the default-route IPv4 with a netlink query.
+
+    A single netlink round-trip returns structured data, with no process
+    creation and no text parsing.
+    """
+    with IPRoute() as ipr:
+        routes = ipr.get_default_routes(family=socket.AF_INET)
+        if not routes:
+            return None
+        oif = routes[0].get_attr("RTA_OIF")
+        if oif is None:
+            return None
+        addrs = ipr.get_addr(index=oif, family=socket.AF_INET)
+        if not addrs:
+            return None
+        address = addrs[0].get_attr("IFA_ADDRESS")
+        if address is None:
+            return None
+        return address.replace(".", "-")
+
+
+def _default_route_ip_from_iproute():
+    # One fork instead of two: the JSON form of the default route already
+    # carries the preferred source address of its interface.
+    try:
+        result = subprocess.run(
+            ["ip", "-j", "-4", "route", "show", "default"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=SUBPROCESS_TIMEOUT,
+        )
+        routes = json.loads(result.stdout)
+        return routes[0]["prefsrc"].replace(".", "-")
+    except (
+        subprocess.CalledProcessError,
+        subprocess.TimeoutExpired,
+        OSError,
+        json.JSONDecodeError,
+        KeyError,
+        IndexError,
+    ):
+        pass
+    return None
+
+
+def get_suggested_hostname():
+    """Return the nip.io hostname suggestion for the default-route IP."""
+    default_ip = get_default_route_ip()
+    if default_ip:
+        return f"jumpstarter.{default_ip}.nip.io"
+    return "jumpstarter.local"
+
+
+def set_root_password(password):
+    """Set the root password via usermod. Returns (success, message).
+
+    The sha512-crypt hash is computed in-process so no plaintext crosses a
+    pipe and no chpasswd child with stdin/stdout plumbing is needed.
+    """
+    if not password:
+        return False, "Root password must not be empty"
+    hashed = crypt.crypt(password, crypt.mksalt(crypt.METHOD_SHA512))
+    try:
+        subprocess.run(
+            ["usermod", "-p", hashed, "root"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=SUBPROCESS_TIMEOUT,
+        )
+        return True, "Root password updated"
+    except subprocess.CalledProcessError as e:
+        return False, f"Failed to set root password: {e.stderr.strip()}"
+    except (subprocess.TimeoutExpired, OSError) as e:
+        return False, f"Failed to set root password: {e}"
+
+
+def set_hostname(hostname):
+    """Set the host name. Returns (success, message).
+
+    Calls sethostname(2) directly and persists /etc/hostname, avoiding the
+    hostnamectl fork/exec and its D-Bus round-trip to systemd-hostnamed.
+    hostnamectl remains as a fallback for environments where the direct
+    syscall is not permitted.
+    """
+    if not hostname or not all(c.isalnum() or c in ".-" for c in hostname):
+        return False, f"Invalid hostname: {hostname!r}"
+    try:
+        socket.sethostname(hostname)
+        Path("/etc/hostname").write_text(hostname + "\n")
+    except OSError:
+        try:
+            subprocess.run(
+                ["hostnamectl", "set-hostname", hostname],
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=SUBPROCESS_TIMEOUT,
+            )
+        except subprocess.CalledProcessError as e:
+            return False, f"Failed to set hostname: {e.stderr.strip()}"
+        except (subprocess.TimeoutExpired, OSError) as e:
+            return False, f"Failed to set hostname: {e}"
+    with _hostname_lock:
+        _hostname_cache["exp"] = 0.0
+    return True, f"Hostname set to {hostname}"
+
+
+JUMPSTARTER_GROUP = "operator.jumpstarter.dev"
+JUMPSTARTER_VERSION = "v1alpha1"
+JUMPSTARTER_PLURAL = "jumpstarters"
+
+_k8s_api = None
+_k8s_lock = threading.Lock()
+
+
+def _custom_objects_api():
+    """Return a CustomObjectsApi client, created once and reused.
+
+    Reusing the client keeps the TLS session to the apiserver alive across
+    config submissions instead of paying kubectl startup, kubeconfig
+    parsing and API discovery on every apply.
+    """
+    global _k8s_api
+    with _k8s_lock:
+        if _k8s_api is None:
+            k8s_config.load_kube_config(config_file=str(KUBECONFIG_PATH))
+            _k8s_api = k8s_client.CustomObjectsApi()
+        return _k8s_api
+
+
+def apply_jumpstarter_cr(base_domain, image):
+    """Create or update the Jumpstarter CR via server-side apply."""
+    cr = {
+        "apiVersion": "operator.jumpstarter.dev/v1alpha1",
+        "kind": "Jumpstarter",
+        "metadata": {
+            "name": "jumpstarter",
+            "namespace": JUMPSTARTER_NAMESPACE,
+        },
+        "spec": {
+            "baseDomain": base_domain,
+            "controller": {"image": image},
+            "routers": {"image": image},
+        },
+    }
+    try:
+        _custom_objects_api().patch_namespaced_custom_object(
+            group=JUMPSTARTER_GROUP,
+            version=JUMPSTARTER_VERSION,
+            namespace=JUMPSTARTER_NAMESPACE,
+            plural=JUMPSTARTER_PLURAL,
+            name=cr["metadata"]["name"],
+            body=cr,
+            field_manager="jumpstarter-ui",
+            force=True,
+            _content_type="application/apply-patch+yaml",
+            _request_timeout=K8S_REQUEST_TIMEOUT,
+        )
+        return True, f"Jumpstarter configured with base domain {base_domain}"
+    except k8s_client.ApiException as e:
+        return False, f"Failed to apply Jumpstarter CR: {e.reason}"
+    except (
+        k8s_config.ConfigException,
+        urllib3.exceptions.HTTPError,
+        OSError,
+    ) as e:
+        # urllib3 raises its own exception types for connection failures
+        # and request timeouts; they do not subclass OSError.
+        return False, f"Failed to apply Jumpstarter CR: {e}"
+
+
+def _render_page(messages):
+    """Render the setup page. Shared by the GET and POST handlers."""
+    return Response(
+        INDEX_TEMPLATE.render(
+            messages=messages,
+            current_hostname=get_current_hostname(),
+            suggested_hostname=get_suggested_hostname(),
+            default_image=DEFAULT_IMAGE,
+        ),
+        mimetype="text/html",
+    )
+
+
+@app.route("/")
+@requires_auth
+def index():
+    return _render_page([])
+
+
+# The rewritten kubeconfig only changes when the source file or the
+# hostname does, so the transformed bytes are cached keyed on both.
+_kubeconfig_cache = {"key": None, "data": None}
+_kubeconfig_lock = threading.Lock()
+
+
+@app.route("/kubeconfig")
+@requires_auth
+def download_kubeconfig():
+    try:
+        mtime_ns = KUBECONFIG_PATH.stat().st_mtime_ns
+    except OSError:
+        return Response("kubeconfig not found", 404)
+    current_hostname = get_current_hostname()
+    key = (current_hostname, mtime_ns)
+    with _kubeconfig_lock:
+        if _kubeconfig_cache["key"] != key:
+            content = KUBECONFIG_PATH.read_text()
+            # Point the server URL at this host instead of localhost and
+            # skip TLS verification, since the generated certificate does
+            # not cover the public hostname.
+            content = _RE_SERVER_LOCALHOST.sub(
+                f"server: https://{current_hostname}:\\1", content
+            )
+            content = _RE_SERVER_LINE.sub(
+                r"\1    insecure-skip-tls-verify: true\n", content
+            )
+            _kubeconfig_cache["data"] = content.encode("utf-8")
+            _kubeconfig_cache["key"] = key
+        data = _kubeconfig_cache["data"]
+    return Response(
+        data,
+        mimetype="application/octet-stream",
+        headers={"Content-Disposition": "attachment; filename=kubeconfig"},
+    )
+
+
+# Pool for running the independent configuration steps concurrently.
+_EXEC = ThreadPoolExecutor(max_workers=4)
+
+
+@app.route("/configure-jumpstarter", methods=["POST"])
+@requires_auth
+def configure_jumpstarter():
+    root_password = request.form.get("root_password", "")
+    base_domain = request.form.get("base_domain", "").strip()
+    image = request.form.get("image", "").strip() or DEFAULT_IMAGE
+
+    # Reject bad input before any subprocess or API work is attempted.
+    if not base_domain:
+        return _render_page([(False, "Base domain is required")])
+
+    # The password and CR steps are independent of the hostname change, so
+    # run them on the pool and overlap their fork/exec and apiserver waits
+    # with the hostnamectl call on this thread.
+    fut_password = _EXEC.submit(set_root_password, root_password)
+    fut_cr = _EXEC.submit(apply_jumpstarter_cr, base_domain, image)
+    hostname_result = set_hostname(base_domain)
+
+    messages = [fut_password.result(), hostname_result, fut_cr.result()]
+    return _render_page(messages)
+
+
+def main():
+    port = int(os.environ.get("PORT", "8080"))
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # Development fallback: the single-threaded Werkzeug dev server.
+        app.run(host="0.0.0.0", port=port)
+        return
+
+    class _Server(BaseApplication):
+        """Run the app under gunicorn with threaded workers.
+
+        The handlers spend most of their time blocked on PAM, chpasswd,
+        hostnamectl or the apiserver, so threaded workers let many
+        requests overlap without the dev server's one-at-a-time limit.
+        """
+
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{port}")
+            self.cfg.set("workers", 2)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", 16)
+
+        def load(self):
+            return app
+
+    _Server().run()
+
+
+if __name__ == "__main__":
+    main()